@@ -1,74 +1,239 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from sqlalchemy import create_engine
-import pymysql
-from datetime import datetime, timedelta
+import numpy as np
+import plotly.graph_objects as go
+from datetime import date, datetime, timedelta
 import traceback
+import os
+import tempfile
+import pymysql
+import pyarrow.parquet as pq
+from utils.db import get_engine, q
+
+# 开启写时复制：选列/切片直接共享内存，只在真正修改时才复制
+pd.options.mode.copy_on_write = True
 
 # 1. 页面配置
 st.set_page_config(layout="wide", page_title="指数动量因子", page_icon="📊")
 
-# 2. 数据库连接管理（使用SQLAlchemy）
-class DBManager:
-    _engines = {}  # 改为字典存储不同数据库的引擎
+PERCENTILE_WINDOW = 252  # 分位值滚动窗口（约一年交易日）
+PRICE_CACHE_DIR = 'cache'  # 本地Parquet价格缓存目录，服务重启后仍可复用
+
+# 分析见解模板，按（动量档位, 分位档位）预先组合，档位 0=低 1=中 2=高
+MOMENTUM_INSIGHTS = [
+    "- **低动量 ({m:.1f}%)**：{idx}近期下跌动能明显，处于下降趋势。",
+    "- **中性动量 ({m:.1f}%)**：{idx}近期走势平稳，缺乏明确趋势。",
+    "- **高动量 ({m:.1f}%)**：{idx}近期上涨动能强劲，处于上升趋势。",
+]
+PERCENTILE_INSIGHTS = [
+    "- **历史低位 ({p:.1f}%)**：当前动量处于历史较低水平，可能孕育反弹机会。",
+    "- **历史中位 ({p:.1f}%)**：当前动量处于历史中等水平，市场情绪平稳。",
+    "- **历史高位 ({p:.1f}%)**：当前动量处于历史较高水平，可能面临回调风险。",
+]
+INSIGHT_TEMPLATES = {
+    (m_b, p_b): m_text + "\n" + p_text
+    for m_b, m_text in enumerate(MOMENTUM_INSIGHTS)
+    for p_b, p_text in enumerate(PERCENTILE_INSIGHTS)
+}
+
+# 2. 数据获取函数（使用SQLAlchemy引擎）
+@st.cache_data(ttl=86400)
+def list_indices(database_name):
+    """获取数据库中的指数表名（服务端过滤掉资金流表）"""
+    engine = get_engine(database_name)
+    if not engine:
+        return ()
     
-    @classmethod
-    def get_engine(cls, database_name):
-        """根据database_name创建并返回SQLAlchemy数据库引擎"""
-        if database_name not in cls._engines:
-            try:
-                # 从secrets获取数据库配置
-                db_config = st.secrets.mysql
-                # 构建数据库连接URI
-                db_uri = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{database_name}"
-                # 创建数据库引擎
-                cls._engines[database_name] = create_engine(
-                    db_uri,
-                    pool_size=5,
-                    max_overflow=10,
-                    pool_recycle=3600,
-                    connect_args={"charset": "utf8mb4"}
-                )
-                st.info(f"数据库 {database_name} 连接成功")
-            except Exception as e:
-                st.error(f"数据库 {database_name} 连接配置错误: {str(e)}")
-                st.error(traceback.format_exc())  # 显示详细错误堆栈
-        return cls._engines.get(database_name)
-
-# 3. 数据获取函数（使用SQLAlchemy引擎）
-@st.cache_data(ttl=600)
-def get_data(database_name, index_name, days, start_date, end_date):
-    """获取指数数据并计算动量因子"""
+    query = """
+    SELECT table_name
+    FROM information_schema.tables
+    WHERE table_schema = %s AND table_name NOT LIKE %s
+    ORDER BY table_name
+    """
+    # 直接用驱动游标取结果，不构造DataFrame
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(query, (database_name, r'%\_flow')).fetchall()
+    return tuple(row[0] for row in rows)
+
+def _price_cache_path(database_name, idx):
+    """指数价格缓存文件路径"""
+    return os.path.join(PRICE_CACHE_DIR, database_name, f"{idx}.parquet")
+
+def fetch_prices(engine, query, params, chunksize=50000):
+    """执行返回 (idx, time, close) 的查询，直接从驱动游标构造 numpy 数组，跳过 pd.read_sql 的封装和类型推断"""
+    idx_parts, time_parts, close_parts = [], [], []
+    conn = engine.raw_connection()
     try:
-        engine = DBManager.get_engine(database_name)
-        if not engine:
-            return pd.DataFrame()
-            
-        # 执行SQL查询
-        query = f"""
-        SELECT time, close 
-        FROM `{index_name}` 
-        WHERE time BETWEEN %s AND %s
-        ORDER BY time
-        """
-        # 使用SQLAlchemy引擎连接执行查询，避免Pandas警告
-        with engine.connect() as conn:
-            df = pd.read_sql(query, conn, params=(start_date, end_date)) 
+        # 服务端游标(SSCursor)分块读取，首次全量同步时不必先把所有结果行缓冲到内存；
+        # with 保证中途出错时也会读完并关闭游标，再把连接归还连接池
+        with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(query, params)
+            while rows := cursor.fetchmany(chunksize):
+                idx_parts.append(np.array([row[0] for row in rows], dtype=object))
+                time_parts.append(np.array([row[1] for row in rows], dtype='datetime64[ns]'))
+                close_parts.append(np.fromiter(
+                    (np.nan if row[2] is None else row[2] for row in rows),
+                    dtype='float64', count=len(rows)
+                ))
+    finally:
+        conn.close()  # 归还连接池
+    
+    if not idx_parts:
+        return np.array([], dtype=object), np.array([], dtype='datetime64[ns]'), np.array([], dtype='float64')
+    return np.concatenate(idx_parts), np.concatenate(time_parts), np.concatenate(close_parts)
+
+def _cached_last_time(path):
+    """从Parquet元数据中 time 列的统计值读取已缓存的最新日期，不读取数据本身"""
+    meta = pq.read_metadata(path)
+    col = meta.schema.names.index('time')
+    stats = [meta.row_group(i).column(col).statistics for i in range(meta.num_row_groups)]
+    if stats and all(s is not None and s.has_min_max for s in stats):
+        return pd.Timestamp(max(s.max for s in stats)).to_pydatetime()
+    # 文件缺少统计值时退回到只读 time 列
+    return pd.read_parquet(path, columns=['time'])['time'].max().to_pydatetime()
+
+def _sync_price_cache(database_name, indices):
+    """把各指数在数据库中新增的日线追加到本地Parquet缓存（增量同步，并刷新已缓存的最新一天）"""
+    engine = get_engine(database_name)
+    
+    # 只从元数据读取每个指数已缓存的最新日期，有新数据时才加载整个文件
+    last_times = {}
+    for idx in indices:
+        path = _price_cache_path(database_name, idx)
+        last_times[idx] = _cached_last_time(path) if os.path.exists(path) else None
+    
+    # 用UNION ALL合并所有指数的增量查询，只需一次数据库往返；
+    # 缓存中最新一天也重新拉取，盘中写入后又被修正的日线才能更新
+    query = " UNION ALL ".join(
+        f"SELECT %s AS idx, time, close FROM {q(idx)} WHERE time >= %s"
+        for idx in indices
+    )
+    params = []
+    for idx in indices:
+        params.extend([idx, last_times[idx] or datetime(1900, 1, 1)])
+    idx_arr, times, closes = fetch_prices(engine, query, tuple(params))
+    if len(idx_arr) == 0:
+        return
+    
+    new_rows = pd.DataFrame({'idx': idx_arr, 'time': times, 'close': closes})
+    cache_dir = os.path.join(PRICE_CACHE_DIR, database_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    for idx, group in new_rows.groupby('idx'):
+        group = group[['time', 'close']]
+        path, last = _price_cache_path(database_name, idx), last_times[idx]
+        if last is not None:
+            # 只拉回了已缓存的最新一天且收盘价未变，无需加载和重写文件
+            if len(group) == 1 and group['time'].iloc[0] == last:
+                cached_last = pd.read_parquet(path, filters=[('time', '==', pd.Timestamp(last))])
+                if group['close'].iloc[0] == cached_last['close'].iloc[-1]:
+                    continue
+            group = pd.concat([pd.read_parquet(path), group], ignore_index=True)
+        df = group.drop_duplicates('time', keep='last').sort_values('time', ignore_index=True)
+        # 每次写入使用独立的临时文件再原子替换，多个会话同时同步同一指数时互不覆盖
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+# 注意：cache_resource 不复制返回值，所有会话共享同一份数组（类似旧版
+# allow_output_mutation=True 的用法）。数组已设为只读，调用方不得原地修改，
+# 需要改动时先 .copy()
+@st.cache_resource(ttl=600)
+def _raw_prices(database_name, indices, start_date, end_date):
+    """获取多个指数的收盘价（日期为 'YYYY-MM-DD' 字符串），返回 (times, closes) 只读矩阵，每列为该指数自身的交易日序列，列与 indices 顺序一致"""
+    _sync_price_cache(database_name, indices)
+    
+    # 从本地缓存按日期范围读取（filters 由pyarrow下推过滤）
+    date_filters = [('time', '>=', pd.Timestamp(start_date)), ('time', '<=', pd.Timestamp(end_date))]
+    frames = [
+        pd.read_parquet(_price_cache_path(database_name, idx), filters=date_filters).assign(idx=idx)
+        for idx in indices
+        if os.path.exists(_price_cache_path(database_name, idx))
+    ]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['idx', 'time', 'close'])
+    
+    # 按各指数自身的交易日排成矩阵：列=指数，行=该指数的第几个交易日；
+    # 不对齐到所有指数的日期并集，较短的列在末尾补 NaT/NaN
+    df = df.sort_values(['idx', 'time'], ignore_index=True)
+    rows = df.groupby('idx', sort=False).cumcount().to_numpy()
+    cols = pd.Categorical(df['idx'], categories=list(indices)).codes
+    shape = (rows.max() + 1 if len(df) else 0, len(indices))
+    times = np.full(shape, np.datetime64('NaT'), dtype='datetime64[ns]')
+    closes = np.full(shape, np.nan)
+    times[rows, cols] = df['time'].to_numpy(dtype='datetime64[ns]')
+    closes[rows, cols] = df['close'].to_numpy(dtype='float64')
+    times.setflags(write=False)
+    closes.setflags(write=False)
+    return times, closes
+
+def momentum_kernel(closes, days):
+    """对收盘价矩阵（列=指数，行=该指数自身的交易日）一次性计算动量，与 pct_change(days) 一致；也可传入单个指数的一维序列"""
+    momentum = np.full_like(closes, np.nan)
+    if days < len(closes):
+        momentum[days:] = closes[days:] / closes[:-days] - 1.0
+    return momentum
+
+@st.cache_data(ttl=86400)
+def latest_percentile(database_name, idx, asof, last_close, days, window=PERCENTILE_WINDOW):
+    """指数在asof日的动量滚动分位值，基于本地缓存的完整历史，与所选起始日期无关"""
+    path = _price_cache_path(database_name, idx)
+    if not os.path.exists(path):
+        return np.nan
+    
+    # 只有新日线入库（asof变化）或最新日线被修正（last_close变化）时才需要重算，只取最后一个窗口所需的行
+    history = pd.read_parquet(path, columns=['close'], filters=[('time', '<=', pd.Timestamp(asof))])
+    closes = history['close'].to_numpy(dtype='float64')[-(window + days):]
+    momentum = momentum_kernel(closes, days)
+    momentum = momentum[~np.isnan(momentum)][-window:]
+    if len(momentum) == 0:
+        return np.nan
+    # 只需最新值在窗口内的名次（并列取平均名次），不足一个窗口时使用全部已有历史
+    last = momentum[-1]
+    return float(((momentum < last).sum() + ((momentum == last).sum() + 1) / 2) / len(momentum))
+
+def get_data_bulk(database_name, indices, days, start_date, end_date):
+    """获取多个指数数据并计算动量因子，返回 {指数: DataFrame}"""
+    try:
+        if not indices or not get_engine(database_name):
+            return {}
+        # 只允许查询数据库中实际存在的指数表
+        unknown = set(indices) - set(list_indices(database_name))
+        if unknown:
+            raise ValueError(f"未知的指数表: {', '.join(sorted(unknown))}")
         
-        if not df.empty:
-            # 计算动量因子和百分位
-            df['momentum'] = df['close'].pct_change(days)
-            df['percentile'] = df['momentum'].rank(pct=True)
+        # 价格按日期范围缓存，调整计算周期时只重算动量，不再查询数据库
+        times, closes = _raw_prices(database_name, indices, start_date, end_date)
+        momentum = momentum_kernel(closes, days)
         
-        return df.dropna()
+        results = {}
+        for j, idx in enumerate(indices):
+            df = pd.DataFrame({
+                'time': times[:, j],
+                'close': closes[:, j],
+                'momentum': momentum[:, j]
+            }).dropna()
+            if not df.empty:
+                results[idx] = df.reset_index(drop=True)
+        return results
     
     except Exception as e:
         st.error(f"数据获取失败: {str(e)}")
         st.error(traceback.format_exc())  # 显示详细错误堆栈
-        return pd.DataFrame()
+        return {}
 
-# 4. 主函数
+def color_percentile(col):
+    """分位值着色：高于80%标红，低于20%标绿（整列向量化计算）"""
+    return np.select(
+        [col > 0.8, col < 0.2],
+        ['background-color: #ffcccc', 'background-color: #ccffcc'],
+        default=''
+    )
+
+# 3. 主函数
 def main():
     st.title("📈 指数动量分析")
     
@@ -81,23 +246,27 @@ def main():
             st.markdown("### ⚙️ 分析参数设置")
             days = st.slider("计算周期(天)", 5, 60, 20, 
                             help="用于计算动量的历史交易日天数")
+            # 默认值取自然日，避免 datetime.now() 每次重跑都不同
+            default_end = date.today()
             date_range = st.date_input(
                 "分析时段", 
-                value=[datetime.now() - timedelta(days=365), datetime.now()],
+                value=[default_end - timedelta(days=365), default_end],
                 help="选择要分析的历史数据范围"
             )
             
             # 获取所有可用指数
-            engine = DBManager.get_engine(database_name)
+            engine = get_engine(database_name)
             if not engine:
                 st.error("无法获取数据库连接")
                 return
                 
-            with engine.connect() as conn:
-                indices = pd.read_sql("SHOW TABLES", conn).iloc[:, 0].tolist()
-            
-            # 过滤表名，只保留指数表（根据实际表名规则调整）
-            index_tables = [t for t in indices if not t.endswith('_flow')]
+            # 指数表列表每个会话只取一次（资金流表在SQL中已过滤），表有增减时手动刷新
+            if st.button("🔄 刷新指数列表"):
+                list_indices.clear()
+                st.session_state.pop('momentum_indices', None)
+            if 'momentum_indices' not in st.session_state:
+                st.session_state['momentum_indices'] = list(list_indices(database_name))
+            index_tables = st.session_state['momentum_indices']
             selected = st.multiselect(
                 "选择指数", 
                 index_tables, 
@@ -107,42 +276,42 @@ def main():
         
         # 主分析逻辑
         if selected and len(date_range) == 2:
-            results, momentum_data = [], pd.DataFrame()
+            results, traces = [], []
             
-            # 显示进度条
-            progress_bar = st.progress(0)
-            total_indices = len(selected)
+            # 缓存键统一为排序后的元组和ISO日期字符串，选择顺序和日期对象类型都不影响缓存命中
+            start_date, end_date = date_range[0].isoformat(), date_range[1].isoformat()
+            # 所有指数一次取回，用单个spinner代替逐个指数刷新的进度条
+            with st.spinner("正在获取指数数据..."):
+                data = get_data_bulk(database_name, tuple(sorted(selected)), days, start_date, end_date)
             
-            for i, idx in enumerate(selected):
-                df = get_data(database_name, idx, days, date_range[0], date_range[1])
+            for idx in selected:
+                df = data.get(idx, pd.DataFrame())
                 if not df.empty:
                     latest = df.iloc[-1]
+                    # 分位值按 (指数, 最新交易日, 最新收盘价, 周期) 单独缓存，每天每个指数只算一次
                     results.append({
                         '指数': idx,
-                        '动量值': f"{latest['momentum']:.2%}",
-                        '分位值': f"{latest['percentile']:.1%}"
+                        '动量值': latest['momentum'],
+                        '分位值': latest_percentile(database_name, idx, latest['time'].isoformat(), float(latest['close']), days)
                     })
-                    momentum_data[idx] = df.set_index('time')['momentum']
-                
-                # 更新进度条
-                progress_bar.progress((i + 1) / total_indices)
-            
-            # 分析完成后隐藏进度条
-            progress_bar.empty()
+                    # 直接用数组构造WebGL折线，无需先拼宽表再melt
+                    traces.append(go.Scattergl(
+                        x=df['time'].to_numpy(),
+                        y=df['momentum'].to_numpy(),
+                        mode='lines',
+                        name=idx
+                    ))
             
             # 显示结果
             if results:
                 # 动量因子走势图
                 st.subheader("📊 指数动量因子走势图")
-                fig = px.line(
-                    momentum_data.reset_index().melt(id_vars='time'), 
-                    x='time', 
-                    y='value', 
-                    color='variable',
-                    labels={'value': '动量值', 'time': '日期'},
-                    title=f'指数动量因子（{days}日周期）'
-                )
+                fig = go.Figure(data=traces)
+                fig.add_hline(y=0, line_dash="dot", line_color="gray")
                 fig.update_layout(
+                    title=f'指数动量因子（{days}日周期）',
+                    xaxis_title='日期',
+                    yaxis_title='动量值',
                     height=500,
                     legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
                 )
@@ -151,11 +320,9 @@ def main():
                 # 动量因子数据表格
                 st.subheader("📋 最新动量因子数据")
                 st.dataframe(
-                    pd.DataFrame(results).style.applymap(
-                        lambda x: 'background-color: #ffcccc' if float(x.strip('%')) > 80 else 
-                                'background-color: #ccffcc' if float(x.strip('%')) < 20 else '',
-                        subset=['分位值']
-                    ), 
+                    pd.DataFrame(results).style
+                        .format({'动量值': '{:.2%}', '分位值': '{:.1%}'})
+                        .apply(color_percentile, subset=['分位值']), 
                     hide_index=True
                 )
                 
@@ -163,31 +330,16 @@ def main():
                 st.subheader("💡 动量因子分析见解")
                 for result in results:
                     index = result['指数']
-                    momentum = float(result['动量值'].strip('%'))
-                    percentile = float(result['分位值'].strip('%'))
-                    
-                    insights = []
-                    
-                    # 动量值分析
-                    if momentum > 5:
-                        insights.append(f"- **高动量 ({momentum:.1f}%)**：{index}近期上涨动能强劲，处于上升趋势。")
-                    elif momentum < -5:
-                        insights.append(f"- **低动量 ({momentum:.1f}%)**：{index}近期下跌动能明显，处于下降趋势。")
-                    else:
-                        insights.append(f"- **中性动量 ({momentum:.1f}%)**：{index}近期走势平稳，缺乏明确趋势。")
+                    momentum = result['动量值'] * 100
+                    percentile = result['分位值'] * 100
                     
-                    # 分位值分析
-                    if percentile > 80:
-                        insights.append(f"- **历史高位 ({percentile:.1f}%)**：当前动量处于历史较高水平，可能面临回调风险。")
-                    elif percentile < 20:
-                        insights.append(f"- **历史低位 ({percentile:.1f}%)**：当前动量处于历史较低水平，可能孕育反弹机会。")
-                    else:
-                        insights.append(f"- **历史中位 ({percentile:.1f}%)**：当前动量处于历史中等水平，市场情绪平稳。")
+                    # 按阈值分档后直接查模板
+                    m_b = 0 if momentum < -5 else 2 if momentum > 5 else 1
+                    p_b = 0 if percentile < 20 else 2 if percentile > 80 else 1
                     
                     # 显示见解
                     with st.expander(f"📌 {index} 因子解读"):
-                        for insight in insights:
-                            st.markdown(insight)
+                        st.markdown(INSIGHT_TEMPLATES[(m_b, p_b)].format(idx=index, m=momentum, p=percentile))
                         st.markdown("---")
                         st.info("""
                         **投资建议参考**：
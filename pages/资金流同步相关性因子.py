@@ -3,13 +3,20 @@ import pandas as pd
 from scipy import stats
 from scipy.stats import norm
 import numpy as np
-from scipy.stats import spearmanr
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.stats import rankdata
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-import seaborn as sns
-from sqlalchemy import create_engine
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import traceback
 import matplotlib as mpl
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils.db import get_engine, q
+
+# 开启写时复制：选列/切片直接共享内存，只在真正修改时才复制
+pd.options.mode.copy_on_write = True
 
 # 添加字体注册代码
 font_path = 'fonts/SimHei.ttf'  # 字体文件路径 
@@ -20,65 +27,97 @@ plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 # 1. 页面配置
 st.set_page_config(layout="wide", page_title="资金流同步相关性因子", page_icon="📊")
 
-# 2. 数据库连接管理（支持多数据库）
-class DBManager:
-    _engines = {}  # 使用字典存储不同数据库的引擎
+# 2. 数据获取函数（支持从不同数据库获取数据）
+@st.cache_data(ttl=3600)
+def list_indices(database_name):
+    """获取数据库中的指数表名（表名对应指数代码）"""
+    engine = get_engine(database_name)
+    if not engine:
+        return ()
     
-    @classmethod
-    def get_engine(cls, database_name=None):
-        """根据database_name创建并返回SQLAlchemy数据库引擎"""
-        if database_name not in cls._engines:
-            try:
-                # 从secrets获取基础配置
-                db_config = st.secrets.mysql
-                # 构建数据库连接URI
-                db_uri = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{database_name if database_name else ''}"
-                # 创建数据库引擎
-                cls._engines[database_name] = create_engine(
-                    db_uri,
-                    pool_size=5,
-                    max_overflow=10,
-                    pool_recycle=3600,
-                    connect_args={"charset": "utf8mb4"}
-                )
-                st.info(f"数据库 {database_name} 连接成功")
-            except Exception as e:
-                st.error(f"数据库 {database_name} 连接错误: {str(e)}")
-                st.error(traceback.format_exc())
-        return cls._engines.get(database_name)
+    # 直接用驱动游标取结果，不构造DataFrame
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("SHOW TABLES").fetchall()
+    return tuple(row[0] for row in rows)
 
-# 3. 数据获取函数（支持从不同数据库获取数据）
-def get_data_from_db(database_name, table_name):
-    """从指定数据库获取表数据"""
-    engine = DBManager.get_engine(database_name)
+# 注意：缓存函数内出错时直接抛出异常（异常不会被缓存），由外层不缓存的函数显示错误，
+# 避免数据库的临时故障被缓存到TTL过期
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_table(database_name, table_name, columns=None, start=None, end=None):
+    """从指定数据库获取表数据（需含 time 列，按时间升序），只取所需列，可选按时间范围过滤；失败时抛出异常"""
+    engine = get_engine(database_name)
     if not engine:
-        return pd.DataFrame()
+        raise ConnectionError(f"无法连接数据库 {database_name}")
     
-    query = f"SELECT * FROM `{table_name}`"
+    # 列投影和时间过滤都在SQL中完成，减少传输的数据量
+    cols = ', '.join(q(c) for c in columns) if columns else '*'
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("time >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("time <= %s")
+        params.append(end)
+    query = f"SELECT {cols} FROM {q(table_name)}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    # 按时间排序返回：滚动相关、收益率差分、区间分箱和前缀和都依赖时间顺序
+    query += " ORDER BY time"
+    with engine.connect() as conn:
+        # time 列读取时即解析为 datetime64，下游无需再转换
+        return pd.read_sql(query, conn, params=tuple(params) if params else None, parse_dates=['time'])
+
+def get_data_from_db(database_name, table_name, columns=None, start=None, end=None):
+    """从指定数据库获取表数据，失败时显示错误并返回空表（失败结果不缓存，下次重跑会重试）"""
     try:
-        df = pd.read_sql(query, engine)
-        return df
+        return _fetch_table(database_name, table_name, columns=columns, start=start, end=end)
     except Exception as e:
         st.error(f"从数据库 {database_name} 获取表 {table_name} 数据失败: {str(e)}")
         return pd.DataFrame()
 
-# 4. 计算资金流同步相关性因子
-def calculate_factor(index_code):
-    """计算因子值"""
-    # 从不同数据库获取大单和小单资金流数据
-    df_large = get_data_from_db('index_big_order', index_code)
-    df_small = get_data_from_db('index_small_order', index_code)
+# 3. 计算资金流同步相关性因子
+def rolling_spearman(x, y, window):
+    """滚动Spearman秩相关：窗口内排名（并列取平均名次）后求Pearson相关，结果与逐窗口 spearmanr 一致"""
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    out = np.full(len(x), np.nan)
+    if len(x) < window:
+        return out
+    
+    # 所有窗口一次性排名，窗口内含NaN时整行为NaN
+    rx = rankdata(sliding_window_view(x, window), axis=1)
+    ry = rankdata(sliding_window_view(y, window), axis=1)
+    rx -= rx.mean(axis=1, keepdims=True)
+    ry -= ry.mean(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[window - 1:] = (rx * ry).sum(axis=1) / np.sqrt((rx * rx).sum(axis=1) * (ry * ry).sum(axis=1))
+    return out
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _calculate_factor(index_code):
+    """计算因子值；取数失败或表结构不符时抛出异常"""
+    # 从不同数据库获取大单和小单资金流数据，两个查询并发执行以重叠网络等待
+    # （各线程从连接池取独立连接；传递脚本上下文，使线程内的st调用和缓存正常工作）
+    with ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as executor:
+        future_large = executor.submit(
+            _fetch_table, 'index_big_order', index_code,
+            columns=['time', 'thscode', 'ths_active_buy_large_amt_hb_index', 'ths_active_sell_large_amt_hb_index']
+        )
+        future_small = executor.submit(
+            _fetch_table, 'index_small_order', index_code,
+            columns=['time', 'thscode', 'ths_active_buy_small_amt_index', 'ths_active_sell_small_amt_index']
+        )
+        df_large, df_small = future_large.result(), future_small.result()
     
     if df_large.empty or df_small.empty:
-        st.warning(f"无法获取 {index_code} 的资金流数据，请检查数据库连接或表名")
         return pd.DataFrame()
     
     # 计算净流入（添加列存在性检查）
     required_columns = ['ths_active_buy_large_amt_hb_index', 'ths_active_sell_large_amt_hb_index',
                         'ths_active_buy_small_amt_index', 'ths_active_sell_small_amt_index']
     if not set(required_columns).issubset(df_large.columns.union(df_small.columns)):
-        st.error("数据库表缺少必要列，请检查表结构")
-        return pd.DataFrame()
+        raise ValueError("数据库表缺少必要列，请检查表结构")
     
     df_large['ELt'] = df_large['ths_active_buy_large_amt_hb_index'] - df_large['ths_active_sell_large_amt_hb_index']
     df_small['St'] = df_small['ths_active_buy_small_amt_index'] - df_small['ths_active_sell_small_amt_index']
@@ -92,15 +131,27 @@ def calculate_factor(index_code):
     )
     
     # 计算20日滚动秩相关系数
-    def rolling_spearman(series1, series2, window):
-        return series1.rolling(window).apply(
-            lambda x: spearmanr(x, series2.loc[x.index])[0], 
-            raw=False
-        )
-    df['RankCorr_ELt_St'] = rolling_spearman(df['ELt'], df['St'], window=20)
-    return df.dropna()
+    window = 20
+    # 因子值在[-1, 1]之间，float32精度足够，缓存和下游合并的体积减半；
+    # 原始金额仍保持float64，避免大额买卖金额相减时损失精度
+    df['RankCorr_ELt_St'] = rolling_spearman(
+        df['ELt'].to_numpy(), df['St'].to_numpy(), window=window
+    ).astype('float32')
+    # 直接切掉前 window-1 行（因子必为NaN），不用 dropna 复制整表；下游绘图/IC各自处理剩余NaN
+    return df.iloc[window - 1:].reset_index(drop=True)
 
-# 5. 指数走势与因子对比绘图（显式传递figure）
+def calculate_factor(index_code):
+    """计算因子值，失败时显示错误并返回空表（失败结果不缓存，下次重跑会重试）"""
+    try:
+        df = _calculate_factor(index_code)
+    except Exception as e:
+        st.error(f"计算 {index_code} 的资金流因子失败: {str(e)}")
+        return pd.DataFrame()
+    if df.empty:
+        st.warning(f"无法获取 {index_code} 的资金流数据，请检查数据库连接或表名")
+    return df
+
+# 4. 指数走势与因子对比绘图（显式传递figure）
 def plot_index_factor_comparison(merged, index_code):
     """绘制双轴对比图"""
     plt.rcParams['axes.unicode_minus'] = False
@@ -127,25 +178,36 @@ def plot_index_factor_comparison(merged, index_code):
     plt.title(f'{index_code}走势与资金流同步性因子', pad=20)
     plt.tight_layout()  # 优化布局
     st.pyplot(fig)  # 传递figure对象
+    plt.close(fig)  # 释放figure，避免重跑时在pyplot中累积
 
-# 6. 因子分布绘图（显式传递figure）
+# 5. 因子分布绘图（显式传递figure）
 def plot_factor_distribution(factor_values, index_code):
     """绘制因子值分布直方图"""
     if factor_values.empty:
         st.warning("因子值为空，无法绘制分布图")
         return
     
+    values = factor_values.to_numpy(dtype='float64')
     fig, ax = plt.subplots(figsize=(12, 6))  # 显式创建figure
-    sns.histplot(factor_values, bins=40, kde=True, color='#d62728', alpha=0.5, edgecolor='w', ax=ax)
+    
+    # 直方图：np.histogram 计数后直接画柱
+    counts, edges = np.histogram(values, bins=40)
+    bin_width = edges[1] - edges[0]
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', color='#d62728', alpha=0.5, edgecolor='w')
+    
+    # 核密度曲线：只在固定网格上求值一次，按直方图计数缩放
+    if np.ptp(values) > 0:
+        grid = np.linspace(edges[0], edges[-1], 200)
+        ax.plot(grid, stats.gaussian_kde(values)(grid) * len(values) * bin_width, color='#d62728', linewidth=1.5)
     
     # 计算统计量
-    mean_val = np.mean(factor_values)
-    median_val = np.median(factor_values)
-    std_val = np.std(factor_values)
+    mean_val = np.mean(values)
+    median_val = np.median(values)
+    std_val = np.std(values)
     
     # 正态分布曲线
-    x = np.linspace(min(factor_values), max(factor_values), 100)
-    normal_curve = stats.norm.pdf(x, loc=mean_val, scale=std_val) * len(factor_values) * (max(factor_values)-min(factor_values))/40
+    x = np.linspace(edges[0], edges[-1], 100)
+    normal_curve = stats.norm.pdf(x, loc=mean_val, scale=std_val) * len(values) * bin_width
     ax.plot(x, normal_curve, 'r--', linewidth=1.5, label='正态分布')
     
     # 添加统计标注
@@ -154,66 +216,92 @@ def plot_factor_distribution(factor_values, index_code):
             transform=ax.transAxes, ha='left', va='top',
             bbox=dict(facecolor='white', alpha=0.8))
     
-    # 分位线
-    for q in [0.1, 0.25, 0.75, 0.9]:
-        q_val = np.quantile(factor_values, q)
+    # 分位线（一次计算所有分位数）
+    quantiles = [0.1, 0.25, 0.75, 0.9]
+    for level, q_val in zip(quantiles, np.quantile(values, quantiles)):
         ax.axvline(x=q_val, color='#7f7f7f', linestyle='--', alpha=0.5)
-        ax.text(q_val, ax.get_ylim()[1]*0.8, f'{int(q*100)}%', rotation=90, va='top', ha='right')
+        ax.text(q_val, ax.get_ylim()[1]*0.8, f'{int(level*100)}%', rotation=90, va='top', ha='right')
     
     # 峰度/偏度
-    kurtosis = stats.kurtosis(factor_values)
-    skewness = stats.skew(factor_values)
+    kurtosis = stats.kurtosis(values)
+    skewness = stats.skew(values)
     ax.text(0.02, 0.75, 
             f'峰度: {kurtosis:.2f}\n偏度: {skewness:.2f}',
             transform=ax.transAxes, ha='left', va='top',
             bbox=dict(facecolor='white', alpha=0.8))
     
-    sns.despine(left=True)
+    for side in ('left', 'top', 'right'):
+        ax.spines[side].set_visible(False)
     ax.set_title(f"{index_code}资金流同步性因子分布特征", pad=20)
     ax.set_xlabel('因子值', fontweight='bold')
     ax.set_ylabel('密度', fontweight='bold')
     ax.legend()
     plt.tight_layout()
     st.pyplot(fig)  # 传递figure对象
+    plt.close(fig)  # 释放figure，避免重跑时在pyplot中累积
 
-# 7. IC值计算与绘图（显式传递figure）
-def plot_ic_values(index_code):
-    """计算不同周期IC值并绘图"""
-    holding_periods = [2, 3, 4, 5, 20]
-    df_factor = calculate_factor(index_code)
-    
-    # 获取指数价格数据（从index_price_day数据库）
-    df_index = get_data_from_db('index_price_day', index_code)
-    if df_index.empty:
-        st.warning(f"无法获取 {index_code} 的价格数据")
-        return
-    
-    df_index['return'] = np.log(df_index['close']).pct_change()
+# 6. IC值计算与绘图
+def period_bins(index, days):
+    """按days天划分时间区间，返回每行所属区间的起始日期（与 pd.Grouper(freq=f'{days}D') 的分箱一致）"""
+    origin = index[0].normalize()
+    step = pd.Timedelta(days=days)
+    return origin + ((index - origin) // step) * step
+
+def grouped_spearman(df, x_col, y_col, keys):
+    """分组Spearman秩相关：组内排名后由分组求和计算Pearson相关；组内含NaN或样本不足时为NaN，与逐组 spearmanr 一致"""
+    ranks = df.groupby(keys)[[x_col, y_col]].rank()
+    dev = ranks - ranks.groupby(keys).transform('mean')
+    cov = (dev[x_col] * dev[y_col]).groupby(keys).sum()
+    var_x = (dev[x_col] ** 2).groupby(keys).sum()
+    var_y = (dev[y_col] ** 2).groupby(keys).sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ic = cov / np.sqrt(var_x * var_y)
+    has_nan = df[[x_col, y_col]].isna().any(axis=1).groupby(keys).any()
+    return ic.mask(has_nan)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def compute_ic_values(index_code, holding_periods, df_factor, df_index):
+    """计算不同持有周期的IC值序列及统计摘要，返回 (ic_results, ic_summary)"""
+    # 数据由 main 传入并参与缓存键哈希（几千行，哈希开销很小），数据有任何变化都会重算
+    # 两个输入均已按时间升序（get_data_from_db 中 ORDER BY time）
+    # 对数收益率 ln(P_t / P_{t-1})，首日无收益率
+    log_close = np.log(df_index['close'].to_numpy(dtype='float64'))
+    returns = np.concatenate([[np.nan], np.diff(log_close)])
     
-    # 合并因子与收益率数据
-    merged = pd.merge(
-        df_factor[['time', 'RankCorr_ELt_St']].rename(columns={'RankCorr_ELt_St': 'factor_value'}),
-        df_index[['time', 'return']],
-        on='time',
-        how='inner'
+    # 按日期把收益率对齐到因子序列：在有序的指数日期上用 searchsorted 定位，
+    # 直接构造以时间为索引的表，省去 merge / set_index 的中间结果
+    factor_time = df_factor['time'].to_numpy()
+    index_time = df_index['time'].to_numpy()
+    pos = np.minimum(np.searchsorted(index_time, factor_time), len(index_time) - 1)
+    matched = index_time[pos] == factor_time
+    merged = pd.DataFrame(
+        {
+            'factor_value': df_factor['RankCorr_ELt_St'].to_numpy()[matched],
+            'return': returns[pos[matched]]
+        },
+        index=pd.DatetimeIndex(factor_time[matched], name='time')
     ).dropna()
     
     if merged.empty:
         st.warning("因子与收益率数据合并后为空")
-        return
+        return pd.DataFrame(), pd.DataFrame()
     
-    merged['time'] = pd.to_datetime(merged['time'])
-    merged.set_index('time', inplace=True)
+    # 一次前缀和得到所有持有期的未来累计收益率 r[t+1] + ... + r[t+h]，末尾不足h天为NaN
+    r = merged['return'].to_numpy()
+    n = len(r)
+    csum = np.concatenate([[0.0], np.cumsum(r)])
+    forward = np.full((n, len(holding_periods)), np.nan)
+    for j, hold_days in enumerate(holding_periods):
+        if hold_days < n:
+            forward[:n - hold_days, j] = csum[hold_days + 1:] - csum[1:n - hold_days + 1]
+    merged[[f'return_{hold_days}d' for hold_days in holding_periods]] = forward
     
     ic_results = []
     for hold_days in holding_periods:
-        # 计算累计收益率
-        merged[f'return_{hold_days}d'] = merged['return'].shift(-1).rolling(hold_days).sum()
-        
-        # 计算IC值
-        ic_values = merged.groupby(pd.Grouper(freq=f'{hold_days}D'))[
-            ['factor_value', f'return_{hold_days}d']
-        ].apply(lambda x: spearmanr(x['factor_value'], x[f'return_{hold_days}d'])[0] if len(x) >= 2 else np.nan)
+        # 计算IC值（每hold_days天一个区间）
+        ic_values = grouped_spearman(
+            merged, 'factor_value', f'return_{hold_days}d', period_bins(merged.index, hold_days)
+        )
         
         # 整理结果
         period_data = pd.DataFrame({
@@ -227,7 +315,7 @@ def plot_ic_values(index_code):
     
     if not ic_results:
         st.warning("未获取到IC计算结果")
-        return
+        return pd.DataFrame(), pd.DataFrame()
     
     ic_results = pd.concat(ic_results, ignore_index=False)
     
@@ -236,45 +324,64 @@ def plot_ic_values(index_code):
         'ic': ['mean', 'std', lambda x: x.mean()/x.std() if x.std()!=0 else np.nan]
     }).rename(columns={'<lambda>': 'ic_ir'})
     ic_summary.columns = ['平均IC', 'IC标准差', 'IC_IR']
+    return ic_results, ic_summary
+
+def plot_ic_values(df_factor, df_index, index_code):
+    """计算不同周期IC值并绘图"""
+    holding_periods = [2, 3, 4, 5, 20]
+    # IC计算结果已缓存，重跑时只需重新绘图
+    ic_results, ic_summary = compute_ic_values(index_code, tuple(holding_periods), df_factor, df_index)
+    if ic_results.empty:
+        return
+    
     st.write("不同周期IC值统计：")
     st.table(ic_summary)
     
-    # 绘制子图
+    # 绘制子图（Plotly在浏览器端渲染，服务端无需栅格化）
     n_periods = len(holding_periods)
-    fig, axes = plt.subplots(n_periods, 2, figsize=(20, 4 * n_periods))  # 显式创建figure
+    fig = make_subplots(
+        rows=n_periods, cols=2,
+        subplot_titles=[title for hold_days in holding_periods
+                        for title in (f'{hold_days}日周期IC值', f'{hold_days}日周期累计IC')]
+    )
     
-    for i, hold_days in enumerate(holding_periods):
+    for i, hold_days in enumerate(holding_periods, start=1):
         period_data = ic_results[ic_results['period'] == f'{hold_days}日']
         if period_data.empty:
             continue
         
         # IC值走势
-        ax_left = axes[i, 0]
-        sns.lineplot(data=period_data, x='date', y='ic', ax=ax_left, marker='o', color='#1f77b4')
-        ax_left.axhline(0, color='gray', linestyle='--')
-        ax_left.set_title(f'{hold_days}日周期IC值', pad=10)
-        ax_left.set_ylabel('IC值')
-        ax_left.tick_params(axis='x', rotation=45)
-        ax_left.text(0.95, 0.95, 
-                     f'平均IC: {ic_summary.loc[f"{hold_days}日", "平均IC"]:.4f}\nIC_IR: {ic_summary.loc[f"{hold_days}日", "IC_IR"]:.2f}',
-                     transform=ax_left.transAxes, ha='right', va='top',
-                     bbox=dict(facecolor='white', alpha=0.8))
+        fig.add_trace(go.Scatter(
+            x=period_data['date'], y=period_data['ic'], mode='lines+markers',
+            line=dict(color='#1f77b4'), name=f'{hold_days}日IC'
+        ), row=i, col=1)
+        fig.add_hline(y=0, line_dash='dash', line_color='gray', row=i, col=1)
+        fig.update_yaxes(title_text='IC值', row=i, col=1)
+        fig.add_annotation(
+            text=f'平均IC: {ic_summary.loc[f"{hold_days}日", "平均IC"]:.4f}<br>IC_IR: {ic_summary.loc[f"{hold_days}日", "IC_IR"]:.2f}',
+            xref='x domain', yref='y domain', x=0.95, y=0.95, xanchor='right', yanchor='top',
+            showarrow=False, bgcolor='rgba(255,255,255,0.8)', row=i, col=1
+        )
         
         # 累计IC走势
-        ax_right = axes[i, 1]
-        sns.lineplot(data=period_data, x='date', y='cumulative_ic', ax=ax_right, marker='o', color='#d62728')
-        ax_right.axhline(0, color='gray', linestyle='--')
-        ax_right.set_title(f'{hold_days}日周期累计IC', pad=10)
-        ax_right.set_xlabel('时间')
-        ax_right.tick_params(axis='x', rotation=45)
-        ax_right.text(0.95, 0.95, 
-                     f'累计IC: {period_data["cumulative_ic"].iloc[-1]:.4f}',
-                     transform=ax_right.transAxes, ha='right', va='top',
-                     bbox=dict(facecolor='white', alpha=0.8))
+        fig.add_trace(go.Scatter(
+            x=period_data['date'], y=period_data['cumulative_ic'], mode='lines+markers',
+            line=dict(color='#d62728'), name=f'{hold_days}日累计IC'
+        ), row=i, col=2)
+        fig.add_hline(y=0, line_dash='dash', line_color='gray', row=i, col=2)
+        fig.update_xaxes(title_text='时间', row=i, col=2)
+        fig.add_annotation(
+            text=f'累计IC: {period_data["cumulative_ic"].iloc[-1]:.4f}',
+            xref='x domain', yref='y domain', x=0.95, y=0.95, xanchor='right', yanchor='top',
+            showarrow=False, bgcolor='rgba(255,255,255,0.8)', row=i, col=2
+        )
     
-    plt.suptitle(f'{index_code}资金流因子IC分析', y=1.02, fontsize=14)
-    plt.tight_layout()
-    st.pyplot(fig)  # 传递figure对象
+    fig.update_layout(
+        title=f'{index_code}资金流因子IC分析',
+        height=300 * n_periods,
+        showlegend=False
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 def main():
     st.title("📈 资金流同步相关性因子分析")
@@ -284,13 +391,12 @@ def main():
             st.markdown("### ⚙️ 分析参数设置")
             
             # 从大单资金流数据库获取可用的指数列表
-            engine = DBManager.get_engine('index_big_order')
+            engine = get_engine('index_big_order')
             if not engine:
                 st.error("无法连接到大单资金流数据库")
                 return
                 
-            with engine.connect() as conn:
-                indices = pd.read_sql("SHOW TABLES", conn).iloc[:, 0].tolist()
+            indices = list(list_indices('index_big_order'))
             
             selected_index = st.selectbox(
                 "选择指数", 
@@ -305,7 +411,7 @@ def main():
             return
         
         # 获取指数价格数据（从index_price_day数据库）
-        df_index = get_data_from_db('index_price_day', selected_index)
+        df_index = get_data_from_db('index_price_day', selected_index, columns=['time', 'close'])
         if df_index.empty:
             st.warning(f"无法获取 {selected_index} 的价格数据")
             return
@@ -330,7 +436,7 @@ def main():
         
         # 绘制IC值分析
         st.subheader("📊 因子预测能力（IC值分析）")
-        plot_ic_values(selected_index)
+        plot_ic_values(df_factor, df_index, selected_index)
         
     except Exception as e:
         st.error(f"应用运行出错: {str(e)}")
@@ -2,34 +2,42 @@
 import streamlit as st
 from sqlalchemy import create_engine
 import traceback
+import re
 
-class DBManager:
-    _engines = {}  # 缓存不同数据库的引擎
+_IDENTIFIER_RE = re.compile(r"[\w.\-]+")
 
-    @classmethod
-    def get_engine(cls, database_name):
-        """根据 database_name 动态创建或返回引擎"""
-        if database_name not in cls._engines:
-            try:
-                # 从 secrets 获取公共配置
-                db_config = st.secrets.mysql
-                
-                # 动态构建连接字符串
-                db_uri = (
-                    f"mysql+pymysql://{db_config['user']}:{db_config['password']}"
-                    f"@{db_config['host']}:{db_config['port']}/{database_name}"
-                )
-                
-                # 创建引擎并缓存
-                cls._engines[database_name] = create_engine(
-                    db_uri,
-                    pool_size=5,
-                    pool_recycle=3600,
-                    connect_args={"charset": "utf8mb4"}
-                )
-                st.success(f"✅ 数据库 {database_name} 连接成功")
-            except Exception as e:
-                st.error(f"❌ 连接数据库 {database_name} 失败: {str(e)}")
-                st.error(traceback.format_exc())
-        
-        return cls._engines.get(database_name)
\ No newline at end of file
+def q(name):
+    """校验并用反引号包裹表名/列名，拒绝含有其他字符的名称，防止SQL注入"""
+    if not _IDENTIFIER_RE.fullmatch(str(name)):
+        raise ValueError(f"非法的表名或列名: {name!r}")
+    return f"`{name}`"
+
+@st.cache_resource
+def _create_engine(database_name):
+    """创建引擎（每个数据库在进程内只创建一次，所有页面共享同一个连接池）"""
+    # 从 secrets 获取公共配置
+    db_config = st.secrets.mysql
+
+    # 动态构建连接字符串
+    db_uri = (
+        f"mysql+pymysql://{db_config['user']}:{db_config['password']}"
+        f"@{db_config['host']}:{db_config['port']}/{database_name}"
+    )
+
+    return create_engine(
+        db_uri,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True,   # 取连接前探活，避免 "MySQL server has gone away"
+        pool_recycle=1800,
+        connect_args={"charset": "utf8mb4"}
+    )
+
+def get_engine(database_name="index_price_day"):
+    """根据 database_name 返回共享引擎，失败时返回 None"""
+    try:
+        return _create_engine(database_name)
+    except Exception as e:
+        st.error(f"❌ 连接数据库 {database_name} 失败: {str(e)}")
+        st.error(traceback.format_exc())
+        return None